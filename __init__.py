@@ -1 +1 @@
-__all__ = ['equation', 'interactiveGraph', 'tex2Web']
\ No newline at end of file
+__all__ = ['equation', 'interactiveGraph', 'parallelEvaluator', 'publish', 'tex2Web']
\ No newline at end of file
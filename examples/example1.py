@@ -1,8 +1,14 @@
+import os
 import sys
+import gzip
+import tempfile
+import numpy as np
 sys.path.insert(0, '../../')
 
 from physfitScripts.interactiveGraph import InteractiveGraph
 from physfitScripts.equation import Equation
+from physfitScripts.parallelEvaluator import ParallelEvaluator
+from physfitScripts.publish import AssetPublisher
 
 # ____________________________________________________________________________________________
 #
@@ -22,7 +28,141 @@ def testInteractiveGraph():
     js = g.assembleJS()
     print(js)
 
+# ____________________________________________________________________________________________
+#
+def testUncertaintyBand():
+    """
+    Uncertainty band for csi = 1 +/- 0.5, exported to JS
+    """
+    def f(t, csi):
+        b = 1.2
+        c = .4
+        return csi + b * t + c * t * t
+
+    eq = Equation(f, ['t'], ['csi', 'b', 'c'])
+    g = InteractiveGraph(eq, xmin = -5, xmax = 5, ymin = -10, ymax = 10, vmin = -5, vmax = 5, scale = 'lin')
+    x, bands = g.plotUncertaintyPyGraph(1, 0.5, nSamples = 2000, seed = 1, batch = True)
+
+    # chunked evaluation gives the same band as a single batch
+    x2, bands2 = g.computeUncertaintyBand(1, 0.5, nSamples = 2000, seed = 1, maxElements = 5000)
+    assert np.allclose(bands, bands2)
+    assert np.all(bands[0] <= bands[1]) and np.all(bands[1] <= bands[2])
+
+    # samples stay within the slider range, without piling up at its limits
+    samples = g.sampleParameter(4.8, 0.5, nSamples = 2000, seed = 1)
+    assert np.all(samples <= 5) and np.sum(samples == 5) == 0
+
+    js = g.assembleJS()
+    assert 'band: {' in js and 'median:' in js
+    g.setBand(x, bands[[0, 2]], percentiles = (5, 95))
+    assert 'median:' not in g.assembleJS()
+
+    # non-finite values are exported as null
+    g.setBand(x, np.full((3, x.size), np.nan))
+    assert 'nan' not in g.assembleJS() and 'null' in g.assembleJS()
+
+    # the grid is exported at full precision, also away from zero
+    g = InteractiveGraph(eq, xmin = 1000, xmax = 1010, ymin = 0, ymax = 1e6, vmin = -5, vmax = 5, scale = 'lin')
+    g.plotUncertaintyPyGraph(1, 0.5, nSamples = 500, maxElements = 10000, seed = 1, batch = True)
+    xJS = g.strBand.split('x: [')[1].split(']')[0].split(',')
+    assert len(set(xJS)) == g.sampleSize and np.allclose(np.array(xJS, dtype = float), np.linspace(1000, 1010, g.sampleSize), rtol = 0, atol = 0)
+    print(js)
+
+# ____________________________________________________________________________________________
+#
+# Functions for the parallel evaluation are defined at module level, so that they can also be
+# sent to the workers with the 'spawn' start method.
+def fParallel(t, csi):
+    return np.sin(csi * t) * np.exp(-0.1 * t * t) + np.log10(1 + csi * csi)
+
+def hParallel(t, csi):
+    return sum([np.sin(csi * t * k) / k for k in range(1, 200)])
+
+def failParallel(t, csi):
+    if np.any(csi == 1):
+        raise ValueError('csi = 1 is not allowed')
+    return csi + 0. * t
+
+def testParallelEvaluator():
+    """
+    Parallel evaluation gives exactly the same results as the serial one
+    """
+    f = fParallel
+    h = hParallel
+
+    eq = Equation(f, ['t'], ['csi'])
+    g = InteractiveGraph(eq, xmin = -5, xmax = 5, ymin = -2, ymax = 2, vmin = -5, vmax = 5)
+    a = np.linspace(-5, 5, 51)
+
+    with ParallelEvaluator(f, nProcesses = 4) as ev:
+        gp = InteractiveGraph(eq, xmin = -5, xmax = 5, ymin = -2, ymax = 2, vmin = -5, vmax = 5, evaluator = ev)
+        assert np.array_equal(g.evaluateCurves(a)[1], gp.evaluateCurves(a)[1])
+        # a single value of the parameter is split along x
+        assert np.array_equal(g.evaluateCurves([1.])[1], gp.evaluateCurves([1.])[1])
+        assert np.array_equal(g.computeUncertaintyBand(1, 0.5, seed = 1)[1], gp.computeUncertaintyBand(1, 0.5, seed = 1)[1])
+        assert ev.evaluate(np.linspace(0, 1, 10), []).shape == (0, 10)
+        gp.plotStaticPyGraph(1, batch = True)
+
+    x = np.linspace(0, 1, 100)
+    with ParallelEvaluator(h, nProcesses = 4, vectorized = False) as ev:
+        assert np.array_equal(ev(x, a), np.vectorize(h)(x[np.newaxis, :], a[:, np.newaxis]))
+
+    # a failed call does not leave results behind for the next one
+    with ParallelEvaluator(failParallel, nProcesses = 4, chunkSize = 1) as ev:
+        try:
+            ev(x, [0., 1., 2., 3.])
+            assert False
+        except ValueError:
+            pass
+        assert np.array_equal(ev(x, [40., 10., 20., 30.])[:, 0], [40., 10., 20., 30.])
+
+# ____________________________________________________________________________________________
+#
+def testAssetPublisher():
+    """
+    Publish the JS of a graph as hashed, precompressed assets
+    """
+    def f(t, csi):
+        b = 1.2
+        c = .4
+        return csi + b * t + c * t * t
+
+    eq = Equation(f, ['t'], ['csi', 'b', 'c'])
+    g = InteractiveGraph(eq, xmin = -5, xmax = 5, ymin = -10, ymax = 10, vmin = -5, vmax = 5, scale = 'lin')
+    js = g.assembleJS()
+
+    outDir = tempfile.mkdtemp()
+    pub = AssetPublisher(outDir)
+    pub.add('slider.js', js)
+    manifest = pub.publish()
+    fileName = manifest['slider.js']
+    assert fileName in pub.written and fileName + '.gz' in pub.written and 'manifest.json' in pub.written
+    assert gzip.decompress(open(os.path.join(outDir, fileName + '.gz'), 'rb').read()) == js.encode('utf-8')
+
+    # nothing is rewritten if the content did not change
+    pub.publish()
+    assert pub.written == []
+
+    # only the changed asset and the manifest are rewritten
+    pub.add('slider.js', js.replace('sampleSize: 300', 'sampleSize: 500'))
+    manifest = pub.publish()
+    assert manifest['slider.js'] != fileName and 'manifest.json' in pub.written
+
+    # content that does not compress is not compressed again on every publish
+    pub.add('noise.bin', os.urandom(4096))
+    pub.publish()
+    compressed = []
+    compressedVariants = pub.compressedVariants
+    pub.compressedVariants = lambda content: compressed.append(content) or compressedVariants(content)
+    pub.publish()
+    assert pub.written == [] and compressed == []
+    assert [f for f in os.listdir(outDir) if f.endswith('.tmp')] == []
+    print(manifest)
+
 # ____________________________________________________________________________________________
 #
 if __name__ == '__main__':
-    testInteractiveGraph()
\ No newline at end of file
+    testInteractiveGraph()
+    testUncertaintyBand()
+    testParallelEvaluator()
+    testAssetPublisher()
\ No newline at end of file
@@ -2,6 +2,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.widgets import Slider, Button, RadioButtons
 from physfitScripts.equation import Equation
+from physfitScripts.parallelEvaluator import evaluateGrid
 
 # ____________________________________________________________________________________________
 #
@@ -58,7 +59,7 @@ class InteractiveGraph:
         sampleSize: 500
         });
     """
-    def __init__(self, equation, xmin = None, xmax = None, ymin = None, ymax = None, vmin = -1e10, vmax = 1e10, xLabel = 'x', yLabel = 'y', startPoint = 0, sampleSize = 300, scale = 'lin'):
+    def __init__(self, equation, xmin = None, xmax = None, ymin = None, ymax = None, vmin = -1e10, vmax = 1e10, xLabel = 'x', yLabel = 'y', startPoint = 0, sampleSize = 300, scale = 'lin', evaluator = None):
         """
         ABOUT
         ------
@@ -73,6 +74,8 @@ class InteractiveGraph:
           startPoint: default position of slider
           sampleSize: number of points to sample the curve
           scale: 
+          evaluator: callable evaluator(x, a) returning an array of shape (len(a), len(x)),
+            e.g. a ParallelEvaluator; if None, the equation is evaluated serially with numpy
         """
         if scale == 'log':
             xmin, xmax = np.log10(xmin), np.log10(xmax)
@@ -89,12 +92,14 @@ class InteractiveGraph:
         self.startPoint = startPoint
         self.sampleSize = sampleSize
         self.scale = scale
+        self.evaluator = evaluator
         self.setBase()
         self.setEquation()
         self.setLimits()
         self.setDomain()
         self.setAxes()
         self.setSlider()
+        self.setBand()
 
     def setBase(self, strBaseBegin = '', strBaseEnd = ''):
         """
@@ -277,13 +282,72 @@ class InteractiveGraph:
         self.strSlider = '    startPoint: %i, \n' % self.startPoint
         self.strSlider = '    sampleSize: %i \n' % self.sampleSize
 
+    def setBand(self, x = None, bands = None, percentiles = (16, 50, 84), precision = 4):
+        """
+        ABOUT
+        -----
+        Set the uncertainty band to be drawn around the curve.
+        The points x are written at full precision. To keep the JS compact, the values of the band
+        are written with a fixed number of decimals, chosen such that the range spanned by the band
+        is resolved with the given number of significant digits.
+        Non-finite values (e.g. log of negative numbers) are written as null.
+        If no band is given, nothing is added to the JS code.
+
+        INPUT
+        -----
+          x: array with the points where the band was evaluated
+          bands: 2D array (one row per percentile) as returned by computeUncertaintyBand
+          percentiles: percentiles corresponding to the rows of bands; the median is only
+            exported if 50 is among them
+          precision: number of significant digits of the exported values, relative to the range of the band
+
+        OUTPUT
+        ------
+        Example
+          band: {
+              x: [-5.0,0.0,5.0],
+              lower: [1.2000,0.9000,1.1000],
+              median: [1.5000,1.0000,1.4000],
+              upper: [1.8000,1.1000,1.7000]
+          },
+        """
+        if x is None or bands is None:
+            self.strBand = ''
+            return
+
+        finite = bands[np.isfinite(bands)]
+        yRange = np.ptp(finite) if finite.size > 0 else 0.
+        if yRange == 0. and finite.size > 0:
+            yRange = np.max(np.abs(finite))
+        decimals = 0
+        if yRange > 0.:
+            decimals = max(0, precision - 1 - int(np.floor(np.log10(yRange))))
+
+        def toArray(values, fmt):
+            return '[' + ','.join([fmt(v) if np.isfinite(v) else 'null' for v in values]) + ']'
+
+        def fmtY(v):
+            return '%.*f' % (decimals, v)
+
+        def fmtX(v):
+            return repr(float(v))
+
+        percentiles = list(percentiles)
+        self.strBand  = '    band: {\n'
+        self.strBand += '        x: %s, \n' % toArray(x, fmtX)
+        self.strBand += '        lower: %s, \n' % toArray(bands[int(np.argmin(percentiles))], fmtY)
+        if 50 in percentiles:
+            self.strBand += '        median: %s, \n' % toArray(bands[percentiles.index(50)], fmtY)
+        self.strBand += '        upper: %s \n' % toArray(bands[int(np.argmax(percentiles))], fmtY)
+        self.strBand += '    }, \n'
+
     def assembleJS(self):
         """
         ABOUT
         -----
         Assembles the parts of the JS SliderGraph object.
         """
-        self.scriptJS = self.strBaseBegin + self.strEquation + self.strLimits + self.strDomain + self.strAxes + self.strSlider + self.strBaseEnd
+        self.scriptJS = self.strBaseBegin + self.strEquation + self.strLimits + self.strDomain + self.strAxes + self.strBand + self.strSlider + self.strBaseEnd
         return self.scriptJS
 
     def plotStaticPyGraph(self, a, batch = False, outputName = ''):
@@ -302,13 +366,145 @@ class InteractiveGraph:
         ------
           Nothing is returned.
         """
-        if self.scale == 'log':
-            x = np.linspace(np.log10(self.xmin), np.log10(self.xmax), self.sampleSize)
-            y = np.log10(self.equation.function(10**x, a))
-        else:
+        x, y = self.evaluateCurves([a])
+        plt.plot(x, y[0])
+        plt.xlabel(self.xAxisLabel)
+        plt.ylabel(self.yAxisLabel)
+        plt.axis([self.xmin, self.xmax, self.ymin, self.ymax])
+        if outputName != '':
+            plt.savefig(outputName)
+        if not batch:
+            plt.show()
+
+    def evaluateCurves(self, a, x = None):
+        """
+        ABOUT
+        -----
+        Evaluate the equation for several values of the parameter at once.
+        The function is called with x as a row and a as a column, so that numpy broadcasting
+        yields one curve per row. Equations should therefore only use numpy operations.
+        For a single value of a, the function is called with a 1D x and a scalar a instead.
+        If an evaluator was given (e.g. ParallelEvaluator), the evaluation is delegated to it.
+
+        INPUT
+        -----
+          a: array of values of the parameter of the slider
+          x: points (in plotting coordinates) where to evaluate; defaults to the canvas range
+
+        OUTPUT
+        ------
+          x, y: x has shape (sampleSize,) and y has shape (len(a), len(x))
+        """
+        if x is None:
             x = np.linspace(self.xmin, self.xmax, self.sampleSize)
-            y = self.equation.function(x, a) 
-        plt.plot(x, y)
+        a = np.asarray(a, dtype = float).ravel()
+        xEval = 10**x if self.scale == 'log' else x
+        if self.evaluator is None:
+            y = evaluateGrid(self.equation.function, xEval, a)
+        else:
+            y = self.evaluator(xEval, a)
+        if self.scale == 'log':
+            y = np.log10(y)
+        return x, y
+
+    def sampleParameter(self, a, aErr, nSamples = 1000, seed = None, maxIterations = 100):
+        """
+        ABOUT
+        -----
+        Draw gaussian samples of the parameter of the slider.
+        Samples outside the range of the slider [vmin, vmax] are rejected and drawn again,
+        i.e. the distribution is a gaussian truncated to the range of the slider.
+
+        INPUT
+        -----
+          a: central value of the parameter
+          aErr: standard deviation of the parameter
+          nSamples: number of samples
+          seed: seed of the random number generator
+          maxIterations: maximum number of redraws before giving up
+
+        OUTPUT
+        ------
+          Array of nSamples values of the parameter.
+        """
+        rng = np.random.default_rng(seed)
+        samples = np.empty(0)
+        for i in range(maxIterations):
+            draws = rng.normal(a, aErr, nSamples - samples.size)
+            draws = draws[(draws >= self.vmin) & (draws <= self.vmax)]
+            samples = np.concatenate((samples, draws))
+            if samples.size == nSamples:
+                return samples
+        raise ValueError('Could not sample the parameter within [%g, %g] for a = %g +/- %g.' % (self.vmin, self.vmax, a, aErr))
+
+    def computeUncertaintyBand(self, a, aErr, nSamples = 1000, percentiles = (16, 50, 84), maxElements = 2**22, seed = None):
+        """
+        ABOUT
+        -----
+        Monte Carlo estimate of the uncertainty band of the curve.
+        The parameter is sampled nSamples times and all curves are evaluated in vectorised batches.
+        The x axis is split in chunks of at most maxElements evaluated points (samples x values of x),
+        and each chunk is reduced to the requested percentiles before evaluating the next one.
+        The peak memory is a few times maxElements values, due to the temporaries of the equation
+        and of the percentile computation.
+
+        INPUT
+        -----
+          a: central value of the parameter
+          aErr: standard deviation of the parameter
+          nSamples: number of Monte Carlo samples
+          percentiles: percentiles to compute for each x (default: median and 1 sigma)
+          maxElements: maximum number of evaluated points per chunk
+          seed: seed of the random number generator
+
+        OUTPUT
+        ------
+          x, bands: x has shape (sampleSize,) and bands has shape (len(percentiles), sampleSize)
+        """
+        samples = self.sampleParameter(a, aErr, nSamples = nSamples, seed = seed)
+        x = np.linspace(self.xmin, self.xmax, self.sampleSize)
+        bands = np.empty((len(percentiles), x.size))
+
+        chunkSize = max(1, maxElements // nSamples)
+        for i in range(0, x.size, chunkSize):
+            _, y = self.evaluateCurves(samples, x = x[i:i + chunkSize])
+            if np.isnan(y).any():
+                bands[:, i:i + chunkSize] = np.nanpercentile(y, percentiles, axis = 0)
+            else:
+                bands[:, i:i + chunkSize] = np.percentile(y, percentiles, axis = 0)
+
+        return x, bands
+
+    def plotUncertaintyPyGraph(self, a, aErr, nSamples = 1000, percentiles = (16, 50, 84), maxElements = 2**22, seed = None, batch = False, outputName = ''):
+        """
+        ABOUT
+        -----
+        Plot a python graph with the uncertainty band for a parameter a +/- aErr.
+        The band is also stored to be exported with assembleJS.
+
+        INPUT
+        -----
+          a: central value of the parameter of the slider
+          aErr: standard deviation of the parameter
+          nSamples: number of Monte Carlo samples
+          percentiles: percentiles of the band; the lowest and highest delimit the band
+            and 50, if present, is drawn as the central curve
+          maxElements: maximum number of evaluated points per chunk (see computeUncertaintyBand)
+          seed: seed of the random number generator
+          batch: if False, displays the graph
+          outputName: name of the output file containing the graph
+
+        OUTPUT
+        ------
+          x, bands: see computeUncertaintyBand
+        """
+        x, bands = self.computeUncertaintyBand(a, aErr, nSamples = nSamples, percentiles = percentiles, maxElements = maxElements, seed = seed)
+        self.setBand(x, bands, percentiles = percentiles)
+
+        percentiles = list(percentiles)
+        plt.fill_between(x, bands[int(np.argmin(percentiles))], bands[int(np.argmax(percentiles))], alpha = 0.3)
+        if 50 in percentiles:
+            plt.plot(x, bands[percentiles.index(50)])
         plt.xlabel(self.xAxisLabel)
         plt.ylabel(self.yAxisLabel)
         plt.axis([self.xmin, self.xmax, self.ymin, self.ymax])
@@ -317,6 +513,8 @@ class InteractiveGraph:
         if not batch:
             plt.show()
 
+        return x, bands
+
     def plotInteractivePyGraph(self, a0 = 0):
         """
         ABOUT
@@ -329,16 +527,11 @@ class InteractiveGraph:
         OUTPUT
         ------
         """
-        if self.scale == 'log':
-            x = np.linspace(np.log10(self.xmin), np.log10(self.xmax), self.sampleSize)
-            y = np.log10(self.equation.function(10**x, a0))
-        else:
-            x = np.linspace(self.xmin, self.xmax, self.sampleSize)
-            y = self.equation.function(x, a0) 
+        x, y = self.evaluateCurves([a0])
 
         fig, ax = plt.subplots()
         plt.subplots_adjust(left = 0.25, bottom = 0.25)
-        l, = plt.plot(x, y)
+        l, = plt.plot(x, y[0])
         plt.axis([self.xmin, self.xmax, self.ymin, self.ymax])
         plt.xlabel(self.xAxisLabel)
         plt.ylabel(self.yAxisLabel)
@@ -348,8 +541,8 @@ class InteractiveGraph:
         slider = Slider(aSlider, sliderLabel, self.vmin, self.vmax, valinit = a0)
 
         def update(a):
-            y = self.equation.function(x, a) 
-            l.set_ydata(y)
+            _, y = self.evaluateCurves([a], x = x)
+            l.set_ydata(y[0])
             fig.canvas.draw_idle()
         slider.on_changed(update)
         
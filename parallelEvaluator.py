@@ -0,0 +1,260 @@
+import weakref
+import numpy as np
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+# ____________________________________________________________________________________________
+#
+def evaluateGrid(function, x, a):
+    """
+    ABOUT
+    -----
+    Evaluate f(x, a) for all combinations of x and a, as done by the serial and parallel paths.
+    For a single value of the parameter, f is called with a 1D x and a scalar a, so that
+    equations written for 1D input keep working. Otherwise f is called with x as a row and
+    a as a column, and numpy broadcasting yields one curve per row.
+
+    INPUT
+    -----
+      function: function f(x, a)
+      x: 1D array of values of the variable
+      a: 1D array of values of the parameter
+
+    OUTPUT
+    ------
+      Array of shape (len(a), len(x)).
+    """
+    if a.size == 1:
+        y = function(x, a[0])
+    else:
+        y = function(x[np.newaxis, :], a[:, np.newaxis])
+    return np.broadcast_to(y, (a.size, x.size))
+
+
+# ____________________________________________________________________________________________
+#
+# State of each worker process: the function, set once by initWorker, and the shared memory
+# block currently attached to, which is kept open between tasks.
+workerState = {}
+
+def initWorker(function, vectorized):
+    """
+    ABOUT
+    -----
+    Initialise a worker process by storing the function to be evaluated.
+    With the 'fork' start method nothing is pickled here, so locally defined functions work;
+    with 'spawn' or 'forkserver' the function must be defined at module level.
+    """
+    workerState['function'] = function if vectorized else np.vectorize(function, otypes = [np.float64])
+    workerState['shm'] = None
+
+def attachWorker(shmName):
+    """
+    ABOUT
+    -----
+    Attach the worker to the shared memory block, reusing the previous attachment if possible.
+    """
+    shm = workerState['shm']
+    if shm is None or shm.name != shmName:
+        if shm is not None:
+            shm.close()
+        shm = shared_memory.SharedMemory(name = shmName)
+        workerState['shm'] = shm
+    return shm
+
+def evaluateChunk(task):
+    """
+    ABOUT
+    -----
+    Evaluate the block [i0, i1) x [j0, j1) of the grid and write it directly into the shared array.
+    Only the block indices are returned to the parent process.
+    """
+    shmName, shape, i0, i1, j0, j1, x, a = task
+    shm = attachWorker(shmName)
+    output = np.ndarray(shape, dtype = np.float64, buffer = shm.buf)
+    output[i0:i1, j0:j1] = evaluateGrid(workerState['function'], x, a)
+    del output
+    return i0, i1, j0, j1
+
+def releaseResources(resources, terminate = False):
+    """
+    ABOUT
+    -----
+    Stop the pool of workers and release the shared memory of a ParallelEvaluator.
+    This is a plain function, so that it can be registered with weakref.finalize.
+
+    INPUT
+    -----
+      resources: dictionary with the 'pool' and 'shm' of the evaluator (entries are set to None)
+      terminate: if True, the workers are stopped immediately, even if they are still running
+    """
+    pool = resources['pool']
+    if pool is not None:
+        if terminate:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+        resources['pool'] = None
+
+    shm = resources['shm']
+    if shm is not None:
+        shm.close()
+        shm.unlink()
+        resources['shm'] = None
+
+
+# ____________________________________________________________________________________________
+#
+class ParallelEvaluator:
+    """
+    ABOUT
+    -----
+    Evaluate an expensive function over a (parameter x variable) grid using several processes.
+    The grid is split in blocks of rows (values of the parameter) and, if there are fewer rows
+    than workers, also of columns (values of the variable). The workers write their results into
+    a multiprocessing.shared_memory array, so no large results are pickled.
+    Each block is computed exactly as in a serial evaluation, so results are identical.
+    The pool of workers and the shared memory are kept between calls; use close() or a with
+    statement to release them (otherwise they are released when the evaluator is garbage
+    collected or at exit). If the evaluation fails, the workers are stopped and the shared memory
+    is released, so that no results of the failed call leak into later calls.
+    The platform default start method is used. Locally defined functions (e.g. defined inside
+    another function) can only be used with startMethod = 'fork', where available.
+
+    EXAMPLE
+    -------
+        from scipy.integrate import quad
+        def f(t, csi):
+            return quad(lambda u: np.exp(-csi * u * u), 0, t)[0]
+
+        eq = Equation(f, ['t'], ['csi'])
+        with ParallelEvaluator(eq.function, nProcesses = 4, vectorized = False) as ev:
+            g = InteractiveGraph(eq, xmin = 0, xmax = 5, ymin = 0, ymax = 2, vmin = 0.1, vmax = 5, evaluator = ev)
+            g.plotStaticPyGraph(1)
+    """
+    def __init__(self, function, nProcesses = None, chunkSize = None, vectorized = True, startMethod = None):
+        """
+        ABOUT
+        -----
+        Initialise the evaluator.
+
+        INPUT
+        -----
+          function: function f(x, a) to be evaluated (e.g. Equation.function)
+          nProcesses: number of worker processes (default: number of CPUs)
+          chunkSize: number of parameter values per task (default: split evenly across workers)
+          vectorized: whether f accepts numpy arrays; if False, f is called for each point
+          startMethod: multiprocessing start method (default: platform default)
+        """
+        self.function = function
+        self.nProcesses = nProcesses if nProcesses is not None else mp.cpu_count()
+        self.chunkSize = chunkSize
+        self.vectorized = vectorized
+        self.startMethod = startMethod
+        self.resources = {'pool': None, 'shm': None}
+        self.finalizer = weakref.finalize(self, releaseResources, self.resources, True)
+
+    def __call__(self, x, a):
+        return self.evaluate(x, a)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        ABOUT
+        -----
+        Stop the worker processes and release the shared memory.
+        """
+        releaseResources(self.resources)
+
+    def getPool(self):
+        """
+        ABOUT
+        -----
+        Return the pool of workers, starting it on first use.
+        """
+        if self.resources['pool'] is None:
+            ctx = mp.get_context(self.startMethod)
+            self.resources['pool'] = ctx.Pool(self.nProcesses, initializer = initWorker, initargs = (self.function, self.vectorized))
+        return self.resources['pool']
+
+    def getSharedMemory(self, size):
+        """
+        ABOUT
+        -----
+        Return a shared memory block of at least size bytes, reusing the current one if large enough.
+        """
+        shm = self.resources['shm']
+        if shm is None or shm.size < size:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            self.resources['shm'] = shared_memory.SharedMemory(create = True, size = size)
+        return self.resources['shm']
+
+    def splitGrid(self, nRows, nColumns):
+        """
+        ABOUT
+        -----
+        Split the grid in blocks, so that there are at least as many blocks as workers
+        (whenever the grid has enough points).
+
+        OUTPUT
+        ------
+          List of tuples (i0, i1, j0, j1) delimiting rows [i0, i1) and columns [j0, j1).
+        """
+        rowChunk = self.chunkSize
+        if rowChunk is None:
+            rowChunk = int(np.ceil(nRows / self.nProcesses))
+        rows = [(i, min(i + rowChunk, nRows)) for i in range(0, nRows, rowChunk)]
+
+        nColumnChunks = min(nColumns, int(np.ceil(self.nProcesses / len(rows))))
+        columnChunk = int(np.ceil(nColumns / nColumnChunks))
+        columns = [(j, min(j + columnChunk, nColumns)) for j in range(0, nColumns, columnChunk)]
+
+        return [(i0, i1, j0, j1) for i0, i1 in rows for j0, j1 in columns]
+
+    def evaluate(self, x, a):
+        """
+        ABOUT
+        -----
+        Evaluate the function for all combinations of x and a.
+
+        INPUT
+        -----
+          x: array of values of the variable
+          a: array of values of the parameter
+
+        OUTPUT
+        ------
+          Array of shape (len(a), len(x)), where row i corresponds to a[i].
+        """
+        x = np.asarray(x, dtype = float).ravel()
+        a = np.asarray(a, dtype = float).ravel()
+        shape = (a.size, x.size)
+        if a.size == 0 or x.size == 0:
+            return np.empty(shape)
+
+        # the shared memory is created before the pool, so that the workers inherit the resource
+        # tracker of this process instead of starting their own (which would unlink it on exit)
+        shm = self.getSharedMemory(a.size * x.size * np.dtype(np.float64).itemsize)
+        pool = self.getPool()
+        tasks = [(shm.name, shape, i0, i1, j0, j1, x[j0:j1], a[i0:i1]) for i0, i1, j0, j1 in self.splitGrid(*shape)]
+        try:
+            for _ in pool.imap_unordered(evaluateChunk, tasks):
+                pass
+        except BaseException:
+            # the remaining tasks may still be writing into the shared memory
+            releaseResources(self.resources, terminate = True)
+            raise
+
+        output = np.ndarray(shape, dtype = np.float64, buffer = shm.buf)
+        y = output.copy()
+        del output
+
+        return y
@@ -0,0 +1,213 @@
+import os
+import gzip
+import json
+import hashlib
+import tempfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ____________________________________________________________________________________________
+#
+class AssetPublisher:
+    """
+    ABOUT
+    -----
+    Write the generated web content (e.g. from TexDoc.convertTex2Website and
+    InteractiveGraph.assembleJS) as static assets ready to be deployed.
+    Each asset is written with its content hash in the file name, together with precompressed
+    .gz (and .br, if the brotli module is installed) variants, so that it can be served as
+    immutable and cached indefinitely.
+    A manifest maps the logical names to the hashed file names.
+    Files whose content did not change are not rewritten.
+
+    EXAMPLE
+    -------
+        pub = AssetPublisher('public/assets')
+        pub.add('slider.js', g.assembleJS())
+        pub.add('content.html', tex.convertTex2Website())
+        manifest = pub.publish()
+        print(manifest)
+    ---
+    The manifest (public/assets/manifest.json) looks like:
+        {
+          "content.html": "content.1f3a9c0b2d4e.html",
+          "slider.js": "slider.8be2d71c09fa.js"
+        }
+    and the output directory contains, e.g., slider.8be2d71c09fa.js, slider.8be2d71c09fa.js.gz
+    and slider.8be2d71c09fa.js.br.
+    """
+    def __init__(self, outDir, manifestName = 'manifest.json', hashLength = 12, minCompressSize = 256):
+        """
+        ABOUT
+        -----
+        Initialise the publisher.
+
+        INPUT
+        -----
+          outDir: directory where the assets are written
+          manifestName: name of the manifest file (written in outDir)
+          hashLength: number of hex digits of the content hash used in the file names
+          minCompressSize: files smaller than this (in bytes) are not precompressed
+        """
+        self.outDir = outDir
+        self.manifestName = manifestName
+        self.hashLength = hashLength
+        self.minCompressSize = minCompressSize
+        self.assets = {}
+        self.written = []
+
+    def add(self, name, content):
+        """
+        ABOUT
+        -----
+        Add an asset to be published.
+
+        INPUT
+        -----
+          name: logical name of the asset (e.g. 'slider.js')
+          content: string or bytes with the content of the asset
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        self.assets[name] = content
+
+    def hashedName(self, name, content):
+        """
+        ABOUT
+        -----
+        Name of the file containing the hash of its content, e.g. slider.js -> slider.8be2d71c09fa.js
+
+        INPUT
+        -----
+          name: logical name of the asset
+          content: bytes with the content of the asset
+
+        OUTPUT
+        ------
+          String with the hashed file name.
+        """
+        digest = hashlib.sha256(content).hexdigest()[:self.hashLength]
+        root, ext = os.path.splitext(name)
+        return '%s.%s%s' % (root, digest, ext)
+
+    def isUpToDate(self, fileName, content):
+        """
+        ABOUT
+        -----
+        Check whether a file in outDir already has exactly this content.
+
+        INPUT
+        -----
+          fileName: name of the file, relative to outDir
+          content: bytes to compare with
+
+        OUTPUT
+        ------
+          True if the file exists with this content, False otherwise.
+        """
+        path = os.path.join(self.outDir, fileName)
+        if os.path.isfile(path) and os.path.getsize(path) == len(content):
+            with open(path, 'rb') as f:
+                return f.read() == content
+        return False
+
+    def writeIfChanged(self, fileName, content):
+        """
+        ABOUT
+        -----
+        Write content to a file in outDir, unless the file already has exactly this content.
+        The file is first written to a uniquely named temporary file in the same directory and
+        then moved, so that a server never sees a partially written asset and concurrent
+        publishers do not interfere. The temporary file is removed if the write fails.
+
+        INPUT
+        -----
+          fileName: name of the file, relative to outDir
+          content: bytes to be written
+
+        OUTPUT
+        ------
+          True if the file was written, False otherwise.
+        """
+        if self.isUpToDate(fileName, content):
+            return False
+
+        path = os.path.join(self.outDir, fileName)
+        dirName = os.path.dirname(path)
+        if dirName != '':
+            os.makedirs(dirName, exist_ok = True)
+        fd, tmpPath = tempfile.mkstemp(dir = dirName if dirName != '' else '.', prefix = '.%s.' % os.path.basename(path), suffix = '.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.chmod(tmpPath, 0o644)
+            os.replace(tmpPath, path)
+        except BaseException:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+            raise
+        self.written.append(fileName)
+        return True
+
+    def compressedVariants(self, content):
+        """
+        ABOUT
+        -----
+        Precompress the content with the available algorithms.
+        gzip is used with mtime = 0, so that the output depends only on the content.
+
+        INPUT
+        -----
+          content: bytes to be compressed
+
+        OUTPUT
+        ------
+          Dictionary mapping the file extension ('.gz', '.br') to the compressed bytes.
+          Variants that are not smaller than the original are discarded.
+        """
+        variants = {}
+        if len(content) < self.minCompressSize:
+            return variants
+
+        variants['.gz'] = gzip.compress(content, compresslevel = 9, mtime = 0)
+        if brotli is not None:
+            variants['.br'] = brotli.compress(content, quality = 11)
+
+        return {ext: data for ext, data in variants.items() if len(data) < len(content)}
+
+    def publish(self):
+        """
+        ABOUT
+        -----
+        Write all assets added so far, their compressed variants and the manifest.
+        The compressed variants are written before the asset itself, so an asset that is already
+        up to date also has its variants, and is neither compressed nor written again.
+        Previous versions of the assets are kept, since pages cached by clients may still refer to them.
+
+        OUTPUT
+        ------
+          Dictionary mapping logical names to hashed file names (content of the manifest).
+          The list of files actually (re)written is stored in self.written.
+        """
+        self.written = []
+        manifestPath = os.path.join(self.outDir, self.manifestName)
+        manifest = {}
+        if os.path.isfile(manifestPath):
+            with open(manifestPath, 'r') as f:
+                manifest = json.load(f)
+
+        for name, content in sorted(self.assets.items()):
+            fileName = self.hashedName(name, content)
+            if not self.isUpToDate(fileName, content):
+                for ext, data in self.compressedVariants(content).items():
+                    self.writeIfChanged(fileName + ext, data)
+                self.writeIfChanged(fileName, content)
+            manifest[name] = fileName
+
+        manifestContent = json.dumps(manifest, indent = 2, sort_keys = True) + '\n'
+        self.writeIfChanged(self.manifestName, manifestContent.encode('utf-8'))
+
+        return manifest